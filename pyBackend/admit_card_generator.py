@@ -2,13 +2,28 @@ from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
+from reportlab.graphics.barcode.qr import QrCodeWidget
+from reportlab.graphics.shapes import Drawing
+from reportlab.graphics import renderPDF
 import io
 import os
 from datetime import datetime
 
-def generate_admit_card(student_data, exam_data_list):
+VERIFICATION_QR_SIZE = 90
+
+def draw_verification_qr(pdf, payload, x, y, size=VERIFICATION_QR_SIZE):
+    """Draw the signed admit card payload as a QR code at (x, y)"""
+    qr = QrCodeWidget(payload, barLevel="M")
+    x1, y1, x2, y2 = qr.getBounds()
+    drawing = Drawing(size, size, transform=[size / (x2 - x1), 0, 0, size / (y2 - y1), 0, 0])
+    drawing.add(qr)
+    renderPDF.draw(drawing, pdf, x, y)
+
+
+def generate_admit_card(student_data, exam_data_list, qr_payload=None):
     """
     Generates an SRM-style admit card PDF with static logos and dynamic student photo.
+    If qr_payload is given, it is printed as a QR code for verification at the hall door.
     """
     buffer = io.BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=A4)
@@ -162,6 +177,12 @@ def generate_admit_card(student_data, exam_data_list):
     pdf.line(40, y + 10, width - 40, y + 10)
 
     # --- Footer Section ---
+    # Keep the end marker, signatures and verification QR together above the footer date
+    footer_height = 80 + (VERIFICATION_QR_SIZE + 25 if qr_payload else 0)
+    if y - footer_height < 55:
+        pdf.showPage()
+        y = height - 100
+
     y -= 20
     pdf.setFont("Helvetica-Bold", 10)
     pdf.setFillColor(colors.red)
@@ -178,6 +199,17 @@ def generate_admit_card(student_data, exam_data_list):
     pdf.line(60, y, 220, y)
     pdf.line(width - 180, y, width - 60, y)
     pdf.line(width - 180, y, width - 60, y)   
+
+    # Verification QR, centred under the HEAD - IEC signature line
+    if qr_payload:
+        try:
+            qr_y = y - 15 - VERIFICATION_QR_SIZE
+            draw_verification_qr(pdf, qr_payload, width - 120 - VERIFICATION_QR_SIZE / 2, qr_y)
+            pdf.setFont("Helvetica", 7)
+            pdf.drawCentredString(width - 120, qr_y - 8, "Scan to verify")
+        except Exception as e:
+            print(f"⚠️ Could not draw verification QR: {e}")
+
     y -= 200
     pdf.setLineWidth(1)
     pdf.line(40, y, width - 40, y)
@@ -219,7 +251,13 @@ if __name__ == "__main__":
         {"subject_code": "21CSC202J", "subject_name": "OPERATING SYSTEMS", "exam_date": "08.09.2025", "exam_time": "Morning"},
     ]
 
-    pdf_buffer = generate_admit_card(student, exams)
+    from admit_card_token import MissingSecretError, sign_admit_payload
+    try:
+        token = sign_admit_payload(student["roll_number"], 3, ["test-session"])
+    except MissingSecretError as e:
+        print(f"⚠️ {e}; generating without QR")
+        token = None
+    pdf_buffer = generate_admit_card(student, exams, qr_payload=token)
     with open("Ayush_Gupta_HallTicket.pdf", "wb") as f:
         f.write(pdf_buffer.getvalue())
     print("✅ Admit card generated: Ayush_Gupta_HallTicket.pdf")
@@ -0,0 +1,150 @@
+import hashlib
+import hmac
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Signed payload carried by the QR code on each hall ticket.
+#
+#   v1|<reg_no>|<sem>|<session_id>,<session_id>,...|<not_before>|<expires>|<mac>
+#
+# Only the standard library is used so invigilators can verify tickets
+# on a laptop with this single file when the main server is unreachable.
+
+TOKEN_VERSION = "v1"
+SEPARATOR = "|"
+MAC_LENGTH = 22  # hex chars of HMAC-SHA256 kept in the QR (88 bits)
+DEFAULT_VALIDITY_DAYS = 120
+# exam_date formats seen in exam_sessions ("2024-12-15", "01.09.2025", ...)
+EXAM_DATE_FORMATS = ["%Y-%m-%d", "%d.%m.%Y", "%d-%m-%Y", "%d/%m/%Y"]
+
+
+class MissingSecretError(RuntimeError):
+    pass
+
+
+def _get_secret(secret=None):
+    """Signing key from the caller or ADMIT_CARD_SECRET; never falls back to a default"""
+    secret = secret or os.getenv("ADMIT_CARD_SECRET", "")
+    if not secret:
+        raise MissingSecretError("ADMIT_CARD_SECRET is not set; refusing to sign or verify admit cards")
+    return secret
+
+
+# Keyed HMAC state is built once and copied per token, so each check only
+# hashes the short payload body.
+_mac_cache = {}
+
+
+def _base_mac(secret):
+    mac = _mac_cache.get(secret)
+    if mac is None:
+        mac = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        _mac_cache[secret] = mac
+    return mac
+
+
+def _sign(body, secret):
+    mac = _base_mac(secret).copy()
+    mac.update(body.encode())
+    return mac.hexdigest()[:MAC_LENGTH]
+
+
+def exam_validity_window(exam_dates):
+    """(not_before, expires) covering the first to the last exam day, in local time"""
+    days = []
+    for exam_date in exam_dates:
+        for fmt in EXAM_DATE_FORMATS:
+            try:
+                days.append(datetime.strptime(str(exam_date).strip(), fmt))
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Unrecognised exam date: '{exam_date}'")
+    if not days:
+        raise ValueError("No exam dates to build a validity window from")
+
+    not_before = min(days)
+    expires = max(days) + timedelta(days=1) - timedelta(seconds=1)
+    return int(not_before.timestamp()), int(expires.timestamp())
+
+
+def sign_admit_payload(reg_no, semester, session_ids, not_before=None, expires=None, secret=None):
+    """Build the signed QR payload for an admit card"""
+    secret = _get_secret(secret)
+    reg_no = str(reg_no).strip()
+    if not reg_no or SEPARATOR in reg_no or "," in reg_no:
+        raise ValueError(f"Invalid registration number for admit card: '{reg_no}'")
+
+    now = int(time.time())
+    not_before = int(not_before) if not_before is not None else now
+    expires = int(expires) if expires is not None else not_before + DEFAULT_VALIDITY_DAYS * 86400
+
+    body = SEPARATOR.join([
+        TOKEN_VERSION,
+        reg_no,
+        str(semester),
+        ",".join(str(session_id) for session_id in session_ids),
+        str(not_before),
+        str(expires),
+    ])
+    return f"{body}{SEPARATOR}{_sign(body, secret)}"
+
+
+def verify_admit_payload(payload, session_id=None, now=None, secret=None):
+    """Check a scanned QR payload without touching the database.
+
+    Door checks should pass the session_id being sat; without it only the
+    signature and validity window are checked and session_checked is False.
+    """
+    secret = _get_secret(secret)
+    body, _, mac = payload.strip().rpartition(SEPARATOR)
+    parts = body.split(SEPARATOR)
+    if len(parts) != 6 or parts[0] != TOKEN_VERSION:
+        return {"valid": False, "reason": "malformed"}
+
+    if not hmac.compare_digest(mac, _sign(body, secret)):
+        return {"valid": False, "reason": "bad_signature"}
+
+    _, reg_no, semester, session_ids, not_before, expires = parts
+    session_ids = session_ids.split(",") if session_ids else []
+    result = {
+        "session_checked": session_id is not None,
+        "reg_no": reg_no,
+        "semester": semester,
+        "session_ids": session_ids,
+        "not_before": int(not_before),
+        "expires": int(expires),
+    }
+
+    now = int(time.time()) if now is None else now
+    if now < result["not_before"]:
+        return {"valid": False, "reason": "not_yet_valid", **result}
+    if now > result["expires"]:
+        return {"valid": False, "reason": "expired", **result}
+    if session_id is not None and session_id not in session_ids:
+        return {"valid": False, "reason": "wrong_session", **result}
+
+    return {"valid": True, "reason": "ok", **result}
+
+
+if __name__ == "__main__":
+    # Offline check: ADMIT_CARD_SECRET=... python admit_card_token.py "<payload>" [session_id]
+    if len(sys.argv) < 2:
+        print("Usage: python admit_card_token.py <payload> [session_id]")
+        sys.exit(2)
+
+    try:
+        check = verify_admit_payload(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    except MissingSecretError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    if check["valid"]:
+        print(f"✅ Valid hall ticket: {check['reg_no']} (semester {check['semester']})")
+        if not check["session_checked"]:
+            print("⚠️ No session_id given, ticket was not checked against the paper being sat")
+    else:
+        print(f"❌ Rejected: {check['reason']}")
+    sys.exit(0 if check["valid"] else 1)
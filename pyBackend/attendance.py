@@ -0,0 +1,107 @@
+import threading
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+# Hall devices post scans in bursts. Scans are collected here and written
+# to MongoDB in one unordered bulk_write of upserts keyed on
+# (exam_session_id, reg_no), so resubmitted or duplicate scans are harmless.
+
+FLUSH_BATCH_SIZE = 500
+FLUSH_INTERVAL_SECONDS = 2
+# Largest batch one request may submit; must stay well under MAX_PENDING_SCANS
+MAX_BATCH_SCANS = 5000
+# Upper bound on unflushed scans; beyond this the API asks devices to retry
+MAX_PENDING_SCANS = 50000
+
+
+class AttendanceBuffer:
+    def __init__(self, flush_size=FLUSH_BATCH_SIZE, max_pending=MAX_PENDING_SCANS):
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Held for a whole flush so a caller can wait for in-flight writes
+        self._flush_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def has_room(self, scan_count=1):
+        return len(self._pending) + scan_count <= self.max_pending
+
+    def add(self, reg_no, exam_session_id, scanned_at=None, device_id=None):
+        """Queue a scan; returns True once the buffer is due for a flush"""
+        scanned_at = scanned_at or datetime.now(timezone.utc)
+        if scanned_at.tzinfo is None:
+            scanned_at = scanned_at.replace(tzinfo=timezone.utc)
+        key = (exam_session_id, reg_no)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = {
+                    "first_scan_at": scanned_at,
+                    "last_scan_at": scanned_at,
+                    "device_id": device_id,
+                }
+            else:
+                # Repeated scans of the same ticket collapse into one write
+                entry["first_scan_at"] = min(entry["first_scan_at"], scanned_at)
+                entry["last_scan_at"] = max(entry["last_scan_at"], scanned_at)
+                if device_id:
+                    entry["device_id"] = device_id
+            return len(self._pending) >= self.flush_size
+
+    def flush(self, collection):
+        """Write all pending scans as idempotent upserts; returns scans written"""
+        with self._flush_lock:
+            return self._flush(collection)
+
+    def _flush(self, collection):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        operations = []
+        for (exam_session_id, reg_no), entry in pending.items():
+            update = {
+                "$min": {"first_scan_at": entry["first_scan_at"]},
+                "$max": {"last_scan_at": entry["last_scan_at"]},
+            }
+            if entry["device_id"]:
+                update["$set"] = {"device_id": entry["device_id"]}
+            operations.append(UpdateOne({"exam_session_id": exam_session_id, "reg_no": reg_no}, update, upsert=True))
+
+        try:
+            collection.bulk_write(operations, ordered=False)
+        except Exception:
+            # Put the batch back so the next flush retries it
+            with self._lock:
+                for key, entry in pending.items():
+                    current = self._pending.get(key)
+                    if current is None:
+                        self._pending[key] = entry
+                    else:
+                        current["first_scan_at"] = min(current["first_scan_at"], entry["first_scan_at"])
+                        current["last_scan_at"] = max(current["last_scan_at"], entry["last_scan_at"])
+                        current["device_id"] = current["device_id"] or entry["device_id"]
+            raise
+        return len(operations)
+
+
+def attendance_rollup(roster_reg_nos, scanned_reg_nos):
+    """Split a semester roster into present/absent against scanned reg_nos"""
+    roster = set(roster_reg_nos)
+    scanned = set(scanned_reg_nos)
+    present = sorted(roster & scanned)
+    absent = sorted(roster - scanned)
+    return {
+        "total": len(roster),
+        "present_count": len(present),
+        "absent_count": len(absent),
+        "present": present,
+        "absent": absent,
+        # Scanned at this session but not on the semester roster
+        "unexpected": sorted(scanned - roster),
+    }
@@ -2,10 +2,19 @@ from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
 from bson import ObjectId
+from dotenv import load_dotenv
+from admit_card_token import MissingSecretError, exam_validity_window, sign_admit_payload, verify_admit_payload
+from attendance import AttendanceBuffer, attendance_rollup, FLUSH_INTERVAL_SECONDS
+from models import AttendanceScan, AttendanceBatch
+import asyncio
 import os
 import json
+import time
+
+# Load MONGODB_URL / ADMIT_CARD_SECRET from pyBackend/.env if present
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
 app = FastAPI(title="Exam Portal API", version="1.0.0")
 
@@ -31,6 +40,7 @@ try:
     subjects_collection = db["subjects"]
     exam_sessions_collection = db["exam_sessions"]
     students_collection = db["students"]
+    attendance_collection = db["attendance"]
     
     MONGO_AVAILABLE = True
     print("✅ MongoDB connected successfully")
@@ -44,6 +54,80 @@ def convert_objectid(doc):
         doc['_id'] = str(doc['_id'])
     return doc
 
+def semester_to_text(sem):
+    """Convert numeric semester to the text format used in students (e.g. 3 → "3rd Semester")"""
+    if isinstance(sem, str):
+        if "Semester" in sem:
+            return sem
+        sem = int(sem) if sem.strip().isdigit() else sem
+    semester_text_map = {
+        1: "1st Semester",
+        2: "2nd Semester",
+        3: "3rd Semester",
+        4: "4th Semester",
+        5: "5th Semester",
+        6: "6th Semester",
+        7: "7th Semester",
+        8: "8th Semester"
+    }
+    return semester_text_map.get(sem, f"{sem}th Semester")
+
+# Attendance scans are buffered in memory and written in batches
+attendance_buffer = AttendanceBuffer()
+# Created in start_attendance_writer so they belong to the server's event loop
+attendance_flush_event = None
+attendance_flush_task = None
+
+# Exam session ids already confirmed to exist, so scans skip the lookup
+known_exam_session_ids = set()
+
+async def attendance_flush_loop():
+    """Flush buffered attendance scans every few seconds, or sooner when the buffer fills"""
+    while True:
+        try:
+            try:
+                await asyncio.wait_for(attendance_flush_event.wait(), timeout=FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            attendance_flush_event.clear()
+            await asyncio.to_thread(attendance_buffer.flush, attendance_collection)
+        except Exception as e:
+            # Keep the writer alive; a dead loop would leave scans unwritten
+            print(f"❌ Attendance flush failed, will retry: {e}")
+            await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_attendance_writer():
+    global attendance_flush_event, attendance_flush_task
+    if not MONGO_AVAILABLE:
+        return
+    attendance_flush_event = asyncio.Event()
+    try:
+        attendance_collection.create_index(
+            [("exam_session_id", ASCENDING), ("reg_no", ASCENDING)], unique=True
+        )
+    except Exception as e:
+        print(f"⚠️ Could not create attendance index: {e}")
+    attendance_flush_task = asyncio.create_task(attendance_flush_loop())
+
+@app.on_event("shutdown")
+async def stop_attendance_writer():
+    if not MONGO_AVAILABLE:
+        return
+    # Stop the loop first so the final flush cannot race an in-flight one
+    if attendance_flush_task is not None:
+        attendance_flush_task.cancel()
+        try:
+            await attendance_flush_task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Attendance writer stopped with error: {e}")
+    try:
+        attendance_buffer.flush(attendance_collection)
+    except Exception as e:
+        print(f"❌ Could not flush attendance on shutdown: {e}")
+
 @app.get("/")
 async def root():
     return {"message": "Exam Portal Backend API", "status": "running", "mongo_available": MONGO_AVAILABLE}
@@ -77,6 +161,7 @@ async def add_exam_session(subject_code: str, exam_date: str, exam_time: str, se
             "sem": sem
         }
         result = exam_sessions_collection.insert_one(exam_data)
+        summary_cache["expires"] = 0
         return {"message": "Exam session added successfully", "id": str(result.inserted_id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding exam session: {str(e)}")
@@ -105,17 +190,7 @@ async def get_students(sem: int = None):
     try:
         # Filter by semester if provided
         if sem is not None:
-            semester_text_map = {
-                1: "1st Semester",
-                2: "2nd Semester",
-                3: "3rd Semester",
-                4: "4th Semester",
-                5: "5th Semester",
-                6: "6th Semester",
-                7: "7th Semester",
-                8: "8th Semester"
-            }
-            semester_text = semester_text_map.get(sem, f"{sem}th Semester")
+            semester_text = semester_to_text(sem)
             query = {"sem": semester_text}
         else:
             query = {}
@@ -159,18 +234,7 @@ async def get_students_by_exam_session(exam_session_id: str):
         print(f"🔍 Looking for students in semester: {exam_semester}")
         
         # Convert numeric semester to text format (e.g., 3 → "3rd Semester")
-        semester_text_map = {
-            1: "1st Semester",
-            2: "2nd Semester", 
-            3: "3rd Semester",
-            4: "4th Semester",
-            5: "5th Semester",
-            6: "6th Semester",
-            7: "7th Semester",
-            8: "8th Semester"
-        }
-        
-        semester_text = semester_text_map.get(exam_semester, f"{exam_semester}th Semester")
+        semester_text = semester_to_text(exam_semester)
         print(f"🔄 Converted semester {exam_semester} → '{semester_text}'")
         
         # Get all students for that semester using text format
@@ -300,9 +364,32 @@ async def generate_admit_card_pdf(student_id: str):
             }
             all_exam_data.append(exam_data)
         
+        # Signed QR payload so invigilators can verify without a DB lookup,
+        # valid from the first exam day to the end of the last one
+        try:
+            not_before, expires = exam_validity_window(
+                [exam_session.get("exam_date", "") for exam_session in exam_sessions]
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Cannot set admit card validity: {str(e)}")
+        
+        try:
+            qr_payload = sign_admit_payload(
+                student.get("reg_no", ""),
+                student_semester_num,
+                [str(exam_session["_id"]) for exam_session in exam_sessions],
+                not_before=not_before,
+                expires=expires
+            )
+        except MissingSecretError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            print(f"⚠️ Admit card will have no verification QR: {e}")
+            qr_payload = None
+        
         # Generate PDF
         from admit_card_generator import generate_admit_card
-        pdf_buffer = generate_admit_card(student_data, all_exam_data)
+        pdf_buffer = generate_admit_card(student_data, all_exam_data, qr_payload=qr_payload)
         
         student_name_clean = student_name.replace(" ", "_")
         return Response(
@@ -311,10 +398,24 @@ async def generate_admit_card_pdf(student_id: str):
             headers={"Content-Disposition": f"attachment; filename=admit_card_{student_name_clean}.pdf"}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error generating admit card: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating admit card: {str(e)}")
 
+@app.get("/verify/")
+async def verify_admit_card(payload: str, session_id: str = None):
+    """Verify a scanned admit card QR payload (stateless, no database lookup).
+
+    Pass session_id at the exam hall door; otherwise the response has
+    session_checked=False and the ticket is not tied to the paper being sat.
+    """
+    try:
+        return verify_admit_payload(payload, session_id=session_id)
+    except MissingSecretError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @app.get("/test-pdf")
 async def test_pdf():
     """Test PDF generation without database"""
@@ -384,17 +485,7 @@ async def delete_exam_sessions(sem: int = None):
         # Handle both text and numeric semester formats
         if sem is not None:
             # Convert numeric semester to text format for querying
-            semester_text_map = {
-                1: "1st Semester",
-                2: "2nd Semester", 
-                3: "3rd Semester",
-                4: "4th Semester",
-                5: "5th Semester",
-                6: "6th Semester", 
-                7: "7th Semester",
-                8: "8th Semester"
-            }
-            semester_text = semester_text_map.get(sem, f"{sem}th Semester")
+            semester_text = semester_to_text(sem)
             
             # Query for both formats
             query = {
@@ -407,10 +498,195 @@ async def delete_exam_sessions(sem: int = None):
             query = {}
             
         result = exam_sessions_collection.delete_many(query)
+        summary_cache["expires"] = 0
+        known_exam_session_ids.clear()
         return {"message": f"Deleted {result.deleted_count} exam session(s)"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting exam sessions: {str(e)}")
 
+def filter_known_exam_sessions(session_ids):
+    """Return the session ids that exist in exam_sessions, looking up only uncached ones"""
+    unchecked = {
+        session_id for session_id in session_ids
+        if session_id not in known_exam_session_ids and ObjectId.is_valid(session_id)
+    }
+    if unchecked:
+        found = exam_sessions_collection.find(
+            {"_id": {"$in": [ObjectId(session_id) for session_id in unchecked]}}, {"_id": 1}
+        )
+        known_exam_session_ids.update(str(doc["_id"]) for doc in found)
+    return {session_id for session_id in session_ids if session_id in known_exam_session_ids}
+
+def check_attendance_capacity(scan_count):
+    """Refuse new scans while the buffer is over its cap (e.g. MongoDB is down)"""
+    if not attendance_buffer.has_room(scan_count):
+        raise HTTPException(status_code=503, detail="Attendance buffer is full, retry shortly")
+
+def queue_attendance_scans(scans):
+    """Buffer scans for known exam sessions; returns the rejected scans"""
+    try:
+        valid_sessions = filter_known_exam_sessions({scan.exam_session_id for scan in scans})
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not check exam sessions: {str(e)}")
+    
+    rejected = []
+    flush_due = False
+    for scan in scans:
+        reg_no = scan.reg_no.strip()
+        if not reg_no or scan.exam_session_id not in valid_sessions:
+            rejected.append(scan)
+            continue
+        flush_due = attendance_buffer.add(reg_no, scan.exam_session_id, scan.scanned_at, scan.device_id) or flush_due
+    if flush_due and attendance_flush_event is not None:
+        attendance_flush_event.set()
+    return rejected
+
+@app.post("/attendance/")
+async def submit_attendance_scan(scan: AttendanceScan):
+    """Submit a single attendance scan from a hall device"""
+    if not MONGO_AVAILABLE:
+        raise HTTPException(status_code=500, detail="MongoDB not available")
+    
+    check_attendance_capacity(1)
+    if queue_attendance_scans([scan]):
+        raise HTTPException(status_code=400, detail="Invalid reg_no or unknown exam session id")
+    return {"message": "Scan accepted", "queued": len(attendance_buffer)}
+
+@app.post("/attendance/batch/")
+async def submit_attendance_batch(batch: AttendanceBatch):
+    """Submit many attendance scans at once; resubmitting the same scans is safe"""
+    if not MONGO_AVAILABLE:
+        raise HTTPException(status_code=500, detail="MongoDB not available")
+    
+    check_attendance_capacity(len(batch.scans))
+    rejected = [scan.model_dump() for scan in queue_attendance_scans(batch.scans)]
+    return {
+        "message": f"Accepted {len(batch.scans) - len(rejected)} scan(s)",
+        "accepted": len(batch.scans) - len(rejected),
+        "rejected": rejected
+    }
+
+@app.get("/attendance/summary/{exam_session_id}")
+async def get_attendance_summary(exam_session_id: str):
+    """Present/absent rollup for an exam session against the semester roster"""
+    if not MONGO_AVAILABLE:
+        return {"error": "MongoDB not available"}
+    
+    if not ObjectId.is_valid(exam_session_id):
+        raise HTTPException(status_code=400, detail="Invalid exam session id")
+    
+    exam_session = exam_sessions_collection.find_one({"_id": ObjectId(exam_session_id)})
+    if not exam_session:
+        raise HTTPException(status_code=404, detail="Exam session not found")
+    
+    try:
+        # Flushes are serialised, so this waits for any in-flight background
+        # write and then writes what is left before the rollup reads
+        await asyncio.to_thread(attendance_buffer.flush, attendance_collection)
+        
+        exam_semester = exam_session.get("sem", "")
+        roster = students_collection.distinct("reg_no", {"sem": semester_to_text(exam_semester)})
+        scanned = attendance_collection.distinct("reg_no", {"exam_session_id": exam_session_id})
+        
+        return {
+            "exam_session": convert_objectid(exam_session),
+            **attendance_rollup(roster, scanned)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building attendance summary: {str(e)}")
+
+# Dashboard summary is cached briefly; exam session changes invalidate it
+SUMMARY_CACHE_SECONDS = 30
+summary_cache = {"expires": 0, "data": None}
+
+def build_summary_pipeline():
+    """Single aggregation over students, exam_sessions and subjects for the dashboard counts.
+
+    There is no filter to push down, so this scans all three collections;
+    the $project stages keep only the few fields the counts need.
+    """
+    return [
+        {"$project": {"_id": 0, "kind": "student", "sem": 1, "pic": 1}},
+        {"$unionWith": {
+            "coll": exam_sessions_collection.name,
+            "pipeline": [{"$project": {"_id": 0, "kind": "session", "sem": 1, "subject_code": 1}}]
+        }},
+        {"$unionWith": {
+            "coll": subjects_collection.name,
+            "pipeline": [{"$project": {"_id": 0, "kind": "subject", "subject_code": 1}}]
+        }},
+        {"$facet": {
+            "students_per_semester": [
+                {"$match": {"kind": "student"}},
+                {"$group": {"_id": "$sem", "count": {"$sum": 1}}}
+            ],
+            "sessions_per_semester": [
+                {"$match": {"kind": "session"}},
+                {"$group": {"_id": "$sem", "count": {"$sum": 1}}}
+            ],
+            "students_missing_photo": [
+                {"$match": {"kind": "student", "$or": [{"pic": {"$exists": False}}, {"pic": {"$in": ["", None]}}]}},
+                {"$count": "count"}
+            ],
+            "subjects_without_exam": [
+                {"$match": {"kind": {"$in": ["subject", "session"]}}},
+                {"$group": {
+                    "_id": None,
+                    "subjects": {"$addToSet": {"$cond": [{"$eq": ["$kind", "subject"]}, "$subject_code", None]}},
+                    "scheduled": {"$addToSet": {"$cond": [{"$eq": ["$kind", "session"]}, "$subject_code", None]}},
+                    "total_subjects": {"$sum": {"$cond": [{"$eq": ["$kind", "subject"]}, 1, 0]}}
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "total_subjects": 1,
+                    "subject_codes": {"$setDifference": ["$subjects", {"$concatArrays": ["$scheduled", [None]]}]}
+                }}
+            ]
+        }}
+    ]
+
+@app.get("/summary/")
+async def get_summary():
+    """Aggregate counts for the dashboard landing page"""
+    if not MONGO_AVAILABLE:
+        return {"error": "MongoDB not available"}
+    
+    if summary_cache["data"] is not None and time.time() < summary_cache["expires"]:
+        return summary_cache["data"]
+    
+    try:
+        facets = next(students_collection.aggregate(build_summary_pipeline()), {})
+        
+        # students store "3rd Semester" while exam sessions may store 3 or "3rd Semester";
+        # key both by the text form so the dashboard can join them
+        def counts_by_semester(rows):
+            counts = {}
+            for row in rows:
+                key = semester_to_text(row["_id"]) if row["_id"] not in (None, "") else "Unknown"
+                counts[key] = counts.get(key, 0) + row["count"]
+            return counts
+        
+        students_per_semester = counts_by_semester(facets.get("students_per_semester", []))
+        sessions_per_semester = counts_by_semester(facets.get("sessions_per_semester", []))
+        missing_photo = facets.get("students_missing_photo") or [{"count": 0}]
+        subject_stats = facets.get("subjects_without_exam") or [{"total_subjects": 0, "subject_codes": []}]
+        unscheduled = sorted(subject_stats[0]["subject_codes"])
+        
+        summary = {
+            "total_students": sum(students_per_semester.values()),
+            "total_sessions": sum(sessions_per_semester.values()),
+            "total_subjects": subject_stats[0]["total_subjects"],
+            "students_per_semester": students_per_semester,
+            "sessions_per_semester": sessions_per_semester,
+            "students_missing_photo": missing_photo[0]["count"],
+            "subjects_without_exam": {"count": len(unscheduled), "subject_codes": unscheduled}
+        }
+        summary_cache["data"] = summary
+        summary_cache["expires"] = time.time() + SUMMARY_CACHE_SECONDS
+        return summary
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building summary: {str(e)}")
+
 @app.get("/health/")
 async def health_check():
     """Health check endpoint"""
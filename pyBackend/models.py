@@ -1,5 +1,7 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime
+from attendance import MAX_BATCH_SCANS
 
 class Subject(BaseModel):
     id: Optional[str] = Field(alias="_id", default=None)
@@ -34,4 +36,14 @@ class Student(BaseModel):
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True
-    )
\ No newline at end of file
+    )
+
+class AttendanceScan(BaseModel):
+    reg_no: str
+    exam_session_id: str
+    scanned_at: Optional[datetime] = None
+    device_id: Optional[str] = None
+
+class AttendanceBatch(BaseModel):
+    # Oversized batches get a 422 rather than an endless 503 retry loop
+    scans: List[AttendanceScan] = Field(max_length=MAX_BATCH_SCANS)